@@ -6,15 +6,31 @@ import datetime
 from pathlib import Path
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pytz
 from luscioustwitch import *
 
 from util.mediacms import MediaCMS_API
+from util.hashindex import MediaHashIndex
+from util.service import ArchiveJobQueue, serve, submit_job, get_job
+from util.spool import SpoolManager
+from util.pagination import iter_clips, iter_videos
+
+# Rough sizes used to reserve spool space before the real size is known.
+CLIP_BYTES_PER_SECOND = 1_000_000
+VOD_BYTES_PER_SECOND = 750_000
+
+VOD_PERIODS = {
+  "day": datetime.timedelta(days = 1),
+  "week": datetime.timedelta(weeks = 1),
+  "month": datetime.timedelta(days = 30)
+}
 
 CLIP_ID_REGEX = re.compile(r'([A-Za-z0-9\-_]{12,})')
 CLIP_LINK_REGEX = re.compile(r'https?:\/\/clips\.twitch\.tv\/([A-Za-z0-9\-_]{12,})')
 MOBILE_LINK_REGEX = re.compile(r'https?:\/\/m\.twitch\.tv\/clip\/([A-Za-z0-9\-_]{12,})')
+UPLOAD_TIME_REGEX = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\s*$', re.MULTILINE)
 
 def get_clip_id_from_string(clip_string : str) -> str:
   m = CLIP_LINK_REGEX.match(clip_string)
@@ -28,6 +44,20 @@ def get_clip_id_from_string(clip_string : str) -> str:
     return m.group(1)
   return None
 
+def get_archived_clips(mediacms_api : MediaCMS_API) -> dict:
+  # Maps clip ID -> archive listing entry, using the clip link in each description.
+  archived = {}
+  for media in mediacms_api.get_clips(strict = True):
+    description = media.get('description', None) or ""
+    for clip_id in CLIP_LINK_REGEX.findall(description) + MOBILE_LINK_REGEX.findall(description):
+      archived[clip_id] = media
+  return archived
+
+def get_video_duration_seconds(duration : str) -> int:
+  m = re.match(r'(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?', duration)
+  hours, minutes, seconds = [int(g) if g else 0 for g in m.groups()]
+  return hours * 3600 + minutes * 60 + seconds
+
 def get_clip_true_time(twitch_api : TwitchAPI, clip_info : TwitchClip):
   if clip_info.video_id != '':
     video_info = twitch_api.get_video(clip_info.video_id)
@@ -38,7 +68,7 @@ def get_clip_true_time(twitch_api : TwitchAPI, clip_info : TwitchClip):
   else:
     return clip_info.created_at
 
-def download_and_archive_clip(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_api : MediaCMS_API, clip_id : str, delete_after : bool) -> bool:
+def download_and_archive_clip(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_api : MediaCMS_API, clip_id : str, output_folder : Path, delete_after : bool, hash_index : MediaHashIndex = None, spool : SpoolManager = None) -> bool:
   try:
     search_result = mediacms_api.search(clip_id.replace("-", " "))
   except Exception as e:
@@ -68,7 +98,7 @@ def download_and_archive_clip(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, m
     return False
   
   clip_info = twitch_api.get_clip(clip_id)
-  clip_filename = f"{clip_info.view_count}_[[{clip_info.clip_id}]].mp4"
+  clip_filename = os.path.join(output_folder, f"{clip_info.view_count}_[[{clip_info.clip_id}]].mp4")
   
   clip_title = clip_info.title
   
@@ -86,21 +116,59 @@ Clip link: https://clips.twitch.tv/{clip_info.clip_id}
 
 Clipped by {clip_info.creator_name}"""
   
-  print(f'Downloading clip {clip_id}...')
-  success = gql_api.download_clip(clip_id, clip_filename, True)
+  reservation = None
+  if spool is not None:
+    reservation = spool.reserve(int(float(clip_info.duration) * CLIP_BYTES_PER_SECOND))
   
-  if success:
-    print(f'Uploading clip to MediaCMS with title "{clip_title}"')
-    resp = mediacms_api.upload_clip(clip_filename, clip_title, clip_description)
+  print(f'Downloading clip {clip_id}...')
+  success = False
+  try:
+    success = gql_api.download_clip(clip_id, clip_filename, True)
+  finally:
+    if spool is not None:
+      spool.commit(reservation, [clip_filename])
+      if not success:
+        spool.remove(clip_filename)
+  
+  duplicate = False
+  uploaded = False
+  try:
+    hash_entry = None
+    if success and hash_index is not None:
+      hash_entry = hash_index.hash_file(clip_filename)
+      match = hash_index.find_match(hash_entry)
+      if match is not None:
+        print(f"Clip '{clip_id}' has the same content as {mediacms_api.base_url}/view?m={match}. Skipping upload.")
+        duplicate = True
+      else:
+        for similar in hash_index.find_similar(hash_entry):
+          print(f"Clip '{clip_id}' looks similar to {mediacms_api.base_url}/view?m={similar}. Uploading anyway.")
     
-  if delete_after:
-    os.remove(clip_filename)
+    if success and not duplicate:
+      print(f'Uploading clip to MediaCMS with title "{clip_title}"')
+      resp = mediacms_api.upload_clip(clip_filename, clip_title, clip_description)
+      uploaded = 'friendly_token' in resp
+      
+      if hash_index is not None and uploaded:
+        hash_index.add(resp['friendly_token'], clip_filename, hash_entry)
+        hash_index.save()
+  finally:
+    # A clip that did not make it into the archive is kept on disk rather than left for eviction.
+    if spool is not None:
+      if delete_after:
+        spool.remove(clip_filename)
+      elif uploaded or duplicate:
+        spool.complete(clip_filename)
+      else:
+        spool.pin(clip_filename)
+    elif delete_after and os.path.exists(clip_filename):
+      os.remove(clip_filename)
     
-  return True
+  return uploaded
 
-def download_video(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, video_id : str, delete_after : bool) -> bool:
+def download_video(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, video_id : str, output_folder : Path, delete_after : bool, spool : SpoolManager = None) -> bool:
   video_info = twitch_api.get_video(video_id)
-  base_filename = f"{video_info.created_at}_[[{video_info.video_id}]]".replace(":", "")
+  base_filename = os.path.join(output_folder, f"{video_info.created_at}_[[{video_info.video_id}]]".replace(":", ""))
   txt_filename = f"{base_filename}.txt"
   video_filename = f"{base_filename}.ts"
   final_video_filename = f"{base_filename}.mp4"
@@ -121,18 +189,43 @@ def download_video(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, video_id : s
   
   success = True
   if not os.path.exists(video_filename) and not os.path.exists(final_video_filename):
-    print(f'Downloading video {video_id}...')
-    gql_api.download_video(video_id, video_filename, "720", False)
-  
-    print(f"Converting temp file to mp4...")
-    o = subprocess.run(['ffmpeg', "-y", "-i", video_filename, "-map", "0:v", "-map", "0:a", "-vcodec", "libx265", "-crf", "24", final_video_filename], capture_output = True)
+    reservation = None
+    if spool is not None:
+      # The .ts and the mp4 being converted from it are both on disk until the conversion finishes.
+      reservation = spool.reserve(2 * get_video_duration_seconds(video_info.duration) * VOD_BYTES_PER_SECOND)
+    
+    converted = False
+    try:
+      print(f'Downloading video {video_id}...')
+      gql_api.download_video(video_id, video_filename, "720", False)
     
-    if delete_after:
+      print(f"Converting temp file to mp4...")
+      o = subprocess.run(['ffmpeg', "-y", "-i", video_filename, "-map", "0:v", "-map", "0:a", "-vcodec", "libx265", "-crf", "24", final_video_filename], capture_output = True)
+      converted = o.returncode == 0
+      if not converted:
+        print(f"Failed to convert {video_filename} to mp4.")
+        success = False
+    finally:
+      if spool is not None:
+        spool.commit(reservation, [video_filename, final_video_filename])
+        if not converted:
+          # Partial files would make the next run skip this vod, so they go.
+          spool.remove(video_filename)
+          spool.remove(final_video_filename)
+        else:
+          # The mp4 is the end product of vodrange and is never evicted.
+          spool.pin(final_video_filename)
+          if delete_after:
+            spool.remove(video_filename)
+          else:
+            spool.complete(video_filename)
+    
+    if spool is None and delete_after:
       os.remove(video_filename)
     
   return success
 
-def archive_from_file(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_api : MediaCMS_API, filepath : Path, output_folder : Path, delete_after : bool):
+def archive_from_file(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_api : MediaCMS_API, filepath : Path, output_folder : Path, delete_after : bool, hash_index : MediaHashIndex = None, spool : SpoolManager = None):
   print(f"Archiving clips from {filepath}")
   if not os.path.exists(filepath):
     print(f"{filepath} does not exist!")
@@ -141,42 +234,35 @@ def archive_from_file(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_
   with open(filepath, 'r') as clipsfile:
     clips = clipsfile.readlines()
     
-  os.chdir(output_folder)
-    
   for clip in clips:
     clip_id = get_clip_id_from_string(clip)
     if clip_id is None:
       print(f"Failed to locate clip ID in {clip}")
       continue
     
-    download_and_archive_clip(twitch_api, gql_api, mediacms_api, clip_id, delete_after)
+    download_and_archive_clip(twitch_api, gql_api, mediacms_api, clip_id, output_folder, delete_after, hash_index, spool)
       
-def archive_clip(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_api : MediaCMS_API, clip_string : str, output_folder : Path, delete_after : bool):
+def archive_clip(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_api : MediaCMS_API, clip_string : str, output_folder : Path, delete_after : bool, hash_index : MediaHashIndex = None, spool : SpoolManager = None) -> bool:
   print(f"Archiving clip {clip_string}")
   clip_id = get_clip_id_from_string(clip_string)
   if clip_id is None:
     print(f"Failed to locate clip ID in {clip_string}")
-    return
-  
-  os.chdir(output_folder)
+    return False
   
-  download_and_archive_clip(twitch_api, gql_api, mediacms_api, clip_id, delete_after)
+  return download_and_archive_clip(twitch_api, gql_api, mediacms_api, clip_id, output_folder, delete_after, hash_index, spool)
   
-def archive_range(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_api : MediaCMS_API, start : str, end : str, minimum : int, broadcaster : str, timezone : str, category_name : str, output_folder : Path, delete_after : bool):
+def archive_range(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_api : MediaCMS_API, start : str, end : str, minimum : int, broadcaster : str, timezone : str, category_name : str, output_folder : Path, delete_after : bool, hash_index : MediaHashIndex = None, spool : SpoolManager = None, max_workers : int = 1) -> int:
   print(f"Archiving {broadcaster} clips from {start} to {end} with at least {minimum} views.")
   
-  os.chdir(output_folder)
-  
   local = pytz.timezone(timezone)
 
-  start_datetime = local.localize(datetime.datetime.strptime(args.start, TWITCH_API_TIME_FORMAT), is_dst=None)
-  end_datetime = local.localize(datetime.datetime.strptime(args.end, TWITCH_API_TIME_FORMAT), is_dst=None)
+  start_datetime = local.localize(datetime.datetime.strptime(start, TWITCH_API_TIME_FORMAT), is_dst=None)
+  end_datetime = local.localize(datetime.datetime.strptime(end, TWITCH_API_TIME_FORMAT), is_dst=None)
   
   broadcaster_id = twitch_api.get_user_id(broadcaster)
 
-  num_clips = 0
   clip_ids = []
-  continue_fetching = True
+  archive_jobs = []
 
   clip_params = {
     "first": 50,
@@ -190,62 +276,58 @@ def archive_range(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_api
     category_id = twitch_api.get_category_id(category_name)
     print(f"{category_name} - {category_id}")
   
-  while continue_fetching:
+  executor = ThreadPoolExecutor(max_workers = max_workers)
+  
+  clip : TwitchClip
+  for clip in iter_clips(twitch_api, clip_params, min_views = minimum, retry_delay = 120):
+    if clip.clip_id in clip_ids:
+      print(f"Got clip {clip.clip_id} twice while fetching")
+      continue
+    
+    clip_match = True
+    
+    if (category_id is not None) and (category_id != clip.game_id):
+      clip_match = False
+    
+    if clip_match:
+      archive_jobs.append(executor.submit(download_and_archive_clip, twitch_api, gql_api, mediacms_api, clip.clip_id, output_folder, delete_after, hash_index, spool))
+      clip_ids.append(clip.clip_id)
+      
+  executor.shutdown(wait = True)
+  num_clips = 0
+  for job in archive_jobs:
     try:
-      clips, cursor = twitch_api.get_clips(params=clip_params)
+      num_clips += 1 if job.result() else 0
     except Exception as e:
       print(e)
-      time.sleep(120)
-      print("Continuing search...")
-      continue
-
-    if cursor != "":
-      clip_params["after"] = cursor
-    else:
-      continue_fetching = False
-
-    clip : TwitchClip
-    for clip in clips:
-      if clip.clip_id in clip_ids:
-        print(f"Got clip {clip.clip_id} twice while fetching")
-        continue
-      
-      clip_match = True
-      
-      if (category_id is not None) and (category_id != clip.game_id):
-        clip_match = False
-      
-      if clip_match:
-        newclip = download_and_archive_clip(twitch_api, gql_api, mediacms_api, clip.clip_id, delete_after)
-        num_clips += 1 if newclip else 0
-        clip_ids.append(clip.clip_id)
-
-      views = int(clip.view_count)
-      if views < minimum:
-        continue_fetching = False
-        break
   print(f"{num_clips} new clips found & archived.")
+  return num_clips
   
-def archive_vod_range(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_api : MediaCMS_API, period : str, vod_type : str, broadcaster : str, output_folder : Path, delete_after : bool, skip_live : bool):
+def archive_vod_range(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_api : MediaCMS_API, period : str, vod_type : str, broadcaster : str, output_folder : Path, delete_after : bool, skip_live : bool, spool : SpoolManager = None, max_workers : int = 1, stop_at_video_id : str = None):
   print(f"Archiving {broadcaster} vods within period {period}.")
   
-  os.chdir(output_folder)
-  
   broadcaster_id = twitch_api.get_user_id(broadcaster)
 
   video_params = {
+    "first": 100,
     "user_id": broadcaster_id,
     "period": period,
     "sort": "time",
     "type": vod_type
   }
+  
+  # Helix ignores period, so the cutoff is applied while paging instead.
+  published_after = None
+  if period in VOD_PERIODS:
+    published_after = datetime.datetime.utcnow() - VOD_PERIODS[period]
       
-  all_videos = twitch_api.get_all_videos(video_params)
+  all_videos = iter_videos(twitch_api, video_params, published_after = published_after, stop_at_video_id = stop_at_video_id)
   
   is_live = twitch_api.is_user_live(broadcaster_id)
   
-  num_videos = 0
   video_ids = []
+  download_jobs = []
+  executor = ThreadPoolExecutor(max_workers = max_workers)
   tnow = datetime.datetime.now()
   for video in all_videos:
     if is_live and skip_live:
@@ -261,11 +343,143 @@ def archive_vod_range(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_
     video_match = True
       
     if video_match:
-      success = download_video(twitch_api, gql_api, video.video_id, delete_after)
-      num_videos += 1 if success else 0
+      download_jobs.append(executor.submit(download_video, twitch_api, gql_api, video.video_id, output_folder, delete_after, spool))
       video_ids.append(video.video_id)
       
+  executor.shutdown(wait = True)
+  num_videos = 0
+  for job in download_jobs:
+    try:
+      num_videos += 1 if job.result() else 0
+    except Exception as e:
+      print(e)
   print(f"{num_videos} videos downloaded.")
+  
+def reconcile_range(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_api : MediaCMS_API, start : str, end : str, minimum : int, broadcaster : str, timezone : str, category_name : str, output_folder : Path, delete_after : bool, report_path : Path, dry_run : bool, hash_index : MediaHashIndex = None, spool : SpoolManager = None, max_workers : int = 1):
+  print(f"Reconciling {broadcaster} clips from {start} to {end} with at least {minimum} views against the archive.")
+  
+  local = pytz.timezone(timezone)
+
+  start_datetime = local.localize(datetime.datetime.strptime(start, TWITCH_API_TIME_FORMAT), is_dst=None)
+  end_datetime = local.localize(datetime.datetime.strptime(end, TWITCH_API_TIME_FORMAT), is_dst=None)
+  
+  broadcaster_id = twitch_api.get_user_id(broadcaster)
+
+  clip_params = {
+    "first": 100,
+    "broadcaster_id": broadcaster_id,
+    "started_at": start_datetime.astimezone(pytz.utc).strftime(TWITCH_API_TIME_FORMAT),
+    "ended_at": end_datetime.astimezone(pytz.utc).strftime(TWITCH_API_TIME_FORMAT)
+  }
+  
+  category_id = None
+  if category_name != "":
+    category_id = twitch_api.get_category_id(category_name)
+    print(f"{category_name} - {category_id}")
+  
+  twitch_ids = set()
+  clip : TwitchClip
+  for clip in iter_clips(twitch_api, clip_params, min_views = minimum, retry_delay = 120):
+    if (category_id is None) or (category_id == clip.game_id):
+      twitch_ids.add(clip.clip_id)
+  print(f"Got {len(twitch_ids)} clips from Twitch.")
+  
+  try:
+    archived = get_archived_clips(mediacms_api)
+  except Exception as e:
+    print("Failed to get the full archive listing. Not reconciling against a partial listing.")
+    print(e)
+    return
+  print(f"Got {len(archived)} clip IDs from the archive.")
+  
+  # Archived clips only count as extra when the upload time in their description falls inside the window.
+  utc_start = start_datetime.astimezone(pytz.utc).strftime("%Y-%m-%d %H:%M:%S")
+  utc_end = end_datetime.astimezone(pytz.utc).strftime("%Y-%m-%d %H:%M:%S")
+  archived_in_window = set()
+  for clip_id, media in archived.items():
+    m = UPLOAD_TIME_REGEX.search(media.get('description', None) or "")
+    if m and utc_start <= m.group(1) <= utc_end:
+      archived_in_window.add(clip_id)
+  
+  missing = twitch_ids - archived.keys()
+  # twitch_ids is cut by the view floor and category, so each remaining candidate is looked up on its own
+  # and only counts as extra when Twitch no longer returns it.
+  extra = set()
+  for clip_id in archived_in_window - twitch_ids:
+    try:
+      clips, _ = twitch_api.get_clips({ "id": clip_id })
+    except Exception as e:
+      print(f"Failed to look up clip {clip_id} on Twitch.")
+      print(e)
+      continue
+    if len(clips) == 0:
+      extra.add(clip_id)
+  
+  report = {
+    'broadcaster': broadcaster,
+    'start': start,
+    'end': end,
+    'minimum': minimum,
+    'twitch_count': len(twitch_ids),
+    'archived_count': len(twitch_ids & archived.keys()),
+    'missing': sorted(missing),
+    'extra': [{ 'id': clip_id, 'url': archived[clip_id]['url'] } for clip_id in sorted(extra)]
+  }
+  
+  with open(report_path, 'w') as reportfile:
+    reportfile.write(json.dumps(report, indent = 2))
+  
+  print(f"{report['archived_count']}/{len(twitch_ids)} clips archived, {len(missing)} missing, {len(extra)} in the archive but not on Twitch. Report written to {report_path}.")
+  
+  if dry_run or len(missing) == 0:
+    return
+  
+  with ThreadPoolExecutor(max_workers = max_workers) as executor:
+    archive_jobs = [executor.submit(download_and_archive_clip, twitch_api, gql_api, mediacms_api, clip_id, output_folder, delete_after, hash_index, spool) for clip_id in sorted(missing)]
+  
+  num_clips = 0
+  for job in archive_jobs:
+    try:
+      num_clips += 1 if job.result() else 0
+    except Exception as e:
+      print(e)
+  print(f"{num_clips} missing clips archived.")
+  
+def expand_archive_request(request : dict):
+  if request['type'] == 'clips':
+    for clip_string in request['clips']:
+      clip_id = get_clip_id_from_string(clip_string.strip())
+      if clip_id is None:
+        print(f"Failed to locate clip ID in {clip_string}")
+        continue
+      yield ('clip', f"clip:{clip_id}", { 'id': clip_id })
+  elif request['type'] == 'range':
+    params = { k: request[k] for k in ['start', 'end', 'minimum', 'broadcaster', 'timezone', 'category'] }
+    yield ('range', f"range:{json.dumps(params, sort_keys = True)}", params)
+  else:
+    raise ValueError(f"Unknown request type \"{request['type']}\".")
+  
+def run_archiver_service(twitch_api : TwitchAPI, gql_api : TwitchGQL_API, mediacms_api : MediaCMS_API, host : str, port : int, output_folder : Path, delete_after : bool, hash_index : MediaHashIndex = None, spool : SpoolManager = None, max_workers : int = 1):
+  # Clip jobs get their own worker so a long range job doesn't hold up single clips sent by the chat bot.
+  handlers = {
+    'clip': lambda p: { 'archived': archive_clip(twitch_api, gql_api, mediacms_api, p['id'], output_folder, delete_after, hash_index, spool) },
+    'range': lambda p: { 'archived': archive_range(twitch_api, gql_api, mediacms_api, p['start'], p['end'], p['minimum'], p['broadcaster'], p['timezone'], p['category'], output_folder, delete_after, hash_index, spool, max_workers) }
+  }
+  
+  lanes = { 'clip': 'clips', 'range': 'ranges' }
+  
+  serve(host, port, ArchiveJobQueue(handlers, lanes), expand_archive_request)
+  
+def submit_to_archiver_service(server_url : str, request : dict):
+  try:
+    jobs = submit_job(server_url, request)
+  except Exception as e:
+    print(f"Failed to submit job to {server_url}.")
+    print(e)
+    return
+  
+  for job in jobs:
+    print(f"{job['id']} {job['status']} {job['key']}")
 
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
@@ -273,6 +487,10 @@ if __name__ == '__main__':
   parser.add_argument("--mediaurl", '-m', default = 'https://clips.itswill.org', help = "MediaCMS URL")
   parser.add_argument("--folder", '-o', default = './output/', help = "Folder to download clips into.")
   parser.add_argument('--delete', '-d', action = 'store_true', help = "Delete clips after archiving.")
+  parser.add_argument('--hashindex', default = None, help = "JSON file holding content hashes of archived media, built with the hashindex sub-command. Uploads whose content is already archived are skipped.")
+  parser.add_argument('--quota', default = None, type = float, help = "Maximum GB of downloads made by this run in the download folder. Uploaded clips and converted .ts files are evicted oldest first to stay under it; vod mp4s and clips that failed to upload are kept and count against it. Files already in the folder are not counted.")
+  parser.add_argument('--jobs', '-j', default = 1, type = int, help = "Number of clips/vods to download at once.")
+  parser.add_argument('--server', default = None, help = "URL of a running archiver service (e.g. http://127.0.0.1:8765). Jobs are submitted to it instead of being run here.")
   
   subparser = parser.add_subparsers(help = "sub-commands help")
   
@@ -287,41 +505,119 @@ if __name__ == '__main__':
   sp = subparser.add_parser("range", help = "Archive clips within a time range.")
   sp.set_defaults(cmd = 'range')
   sp.add_argument('--start', "-s", required=True, help="Start of clip search")
-  sp.add_argument('--end', "-e", default=datetime.now().strftime(TWITCH_API_TIME_FORMAT), help="End of clip search")
+  sp.add_argument('--end', "-e", default=datetime.datetime.now().strftime(TWITCH_API_TIME_FORMAT), help="End of clip search")
   sp.add_argument('--minimum', "-m", default=25, type=int, help="Minimum number of views for a clip to get downloaded")
   sp.add_argument('--broadcaster', '-b', default="itswill", help="Broadcaster name.")
   sp.add_argument('--timezone', '-z', default="America/Los_Angeles", help="Timezone for start/end timestamps.")
   sp.add_argument('--category', '-c', default = "", help = "Only fetch clips in one game/category.")
   
+  sp = subparser.add_parser("reconcile", help = "Compare clips within a time range against the archive and only archive the missing ones.")
+  sp.set_defaults(cmd = 'reconcile')
+  sp.add_argument('--start', "-s", required=True, help="Start of clip search")
+  sp.add_argument('--end', "-e", default=datetime.datetime.now().strftime(TWITCH_API_TIME_FORMAT), help="End of clip search")
+  sp.add_argument('--minimum', "-m", default=25, type=int, help="Minimum number of views for a clip to be expected in the archive")
+  sp.add_argument('--broadcaster', '-b', default="itswill", help="Broadcaster name.")
+  sp.add_argument('--timezone', '-z', default="America/Los_Angeles", help="Timezone for start/end timestamps.")
+  sp.add_argument('--category', '-c', default = "", help = "Only check clips in one game/category.")
+  sp.add_argument('--report', '-r', default = "./reconcile.json", help = "File to write the missing/extra report to.")
+  sp.add_argument('--dryrun', action = "store_true", help = "Only write the report, don't archive missing clips.")
+  
   sp = subparser.add_parser("vodrange", help = "Archive clips within a time range.")
   sp.set_defaults(cmd = 'vodrange')
-  sp.add_argument('--period', "-p", required=True, help="Period of vod search. DOES NOT WORK TWITCH API IS BROKEN!", choices = ["all", "day", "month", "week"])
+  sp.add_argument('--period', "-p", required=True, help="Only archive vods published within this period.", choices = ["all", "day", "month", "week"])
   sp.add_argument('--type', "-t", required=True, help="Type of vods.", choices = ["all", "archive", "highlight", "upload"])
   sp.add_argument('--broadcaster', '-b', default="itswill", help="Broadcaster name.")
   sp.add_argument('--skiplive', action="store_true", help = "Skip the current livestream.")
+  sp.add_argument('--stopat', default = None, help = "Stop at this vod ID, e.g. the newest vod that is already archived.")
+  
+  sp = subparser.add_parser("hashindex", help = "Build or update the --hashindex file from the MediaCMS library.")
+  sp.set_defaults(cmd = 'hashindex')
+  
+  sp = subparser.add_parser("serve", help = "Run a long-lived archiver service that accepts clip and range jobs.")
+  sp.set_defaults(cmd = 'serve')
+  sp.add_argument('--host', default = "127.0.0.1", help = "Address to listen on.")
+  sp.add_argument('--port', '-p', default = 8765, type = int, help = "Port to listen on.")
+  
+  sp = subparser.add_parser("status", help = "Show the status of a job on the archiver service.")
+  sp.set_defaults(cmd = 'status')
+  sp.add_argument('--job', '-j', required = True, help = "Job ID.")
   
   args = parser.parse_args()
   
+  if args.cmd == 'status':
+    if args.server is None:
+      print("--server is required to check job status.")
+      exit(-1)
+    try:
+      job = get_job(args.server, args.job)
+    except Exception as e:
+      print(f"Failed to get job {args.job} from {args.server}.")
+      print(e)
+      exit(-1)
+    print(json.dumps(job, indent = 2))
+    exit(0)
+  
+  if args.server is not None and args.cmd in ['file', 'single', 'range']:
+    if args.cmd == 'file':
+      with open(args.file, 'r') as clipsfile:
+        request = { 'type': 'clips', 'clips': clipsfile.readlines() }
+    elif args.cmd == 'single':
+      request = { 'type': 'clips', 'clips': [args.id] }
+    else:
+      request = { 'type': 'range', 'start': args.start, 'end': args.end, 'minimum': args.minimum, 'broadcaster': args.broadcaster, 'timezone': args.timezone, 'category': args.category }
+    
+    submit_to_archiver_service(args.server, request)
+    exit(0)
+  
   with open(args.secrets, 'r') as cred_file:
     cred_json = json.load(cred_file)
     twitch_api = TwitchAPI(credentials = cred_json['TWITCH'])
     gql_api = TwitchGQL_API()
     mediacms_api = MediaCMS_API(args.mediaurl, (cred_json['MEDIACMS']['USERNAME'], cred_json['MEDIACMS']['PASSWORD']))
     
-  output_folder = Path(args.folder)
+  hash_index = None
+  if args.hashindex is not None:
+    hash_index = MediaHashIndex(args.hashindex)
+    if len(hash_index.entries) == 0 and args.cmd != 'hashindex':
+      print(f"{args.hashindex} is empty, run the hashindex sub-command to build it.")
+      
+  if args.cmd == 'hashindex':
+    if hash_index is None:
+      print("--hashindex is required to build the hash index.")
+      exit(-1)
+    try:
+      failed = hash_index.sync(mediacms_api)
+    except Exception as e:
+      print("Failed to get the full archive listing. The hash index was not updated.")
+      print(e)
+      exit(-1)
+    print(f"Hash index has {len(hash_index.entries)} entries, {failed} archived clips could not be hashed.")
+    exit(0)
+    
+  output_folder = Path(os.path.abspath(args.folder))
   if not os.path.exists(output_folder):
     os.makedirs(output_folder)
+    
+  spool = None
+  if args.quota is not None:
+    spool = SpoolManager(output_folder, int(args.quota * 1024 * 1024 * 1024))
   
   if args.cmd == 'file':
     filepath = Path(args.file)
-    archive_from_file(twitch_api, gql_api, mediacms_api, filepath, output_folder, args.delete)
+    archive_from_file(twitch_api, gql_api, mediacms_api, filepath, output_folder, args.delete, hash_index, spool)
     
   if args.cmd == 'single':
-    archive_clip(twitch_api, gql_api, mediacms_api, args.id, output_folder, args.delete)
+    archive_clip(twitch_api, gql_api, mediacms_api, args.id, output_folder, args.delete, hash_index, spool)
     
   if args.cmd == 'range':
-    archive_range(twitch_api, gql_api, mediacms_api, args.start, args.end, args.minimum, args.broadcaster, args.timezone, args.category, output_folder, args.delete)
+    archive_range(twitch_api, gql_api, mediacms_api, args.start, args.end, args.minimum, args.broadcaster, args.timezone, args.category, output_folder, args.delete, hash_index, spool, args.jobs)
+    
+  if args.cmd == 'reconcile':
+    reconcile_range(twitch_api, gql_api, mediacms_api, args.start, args.end, args.minimum, args.broadcaster, args.timezone, args.category, output_folder, args.delete, Path(args.report), args.dryrun, hash_index, spool, args.jobs)
     
   if args.cmd == 'vodrange':
-    archive_vod_range(twitch_api, gql_api, mediacms_api, args.period, args.type, args.broadcaster, output_folder, args.delete, args.skiplive)
+    archive_vod_range(twitch_api, gql_api, mediacms_api, args.period, args.type, args.broadcaster, output_folder, args.delete, args.skiplive, spool, args.jobs, args.stopat)
+    
+  if args.cmd == 'serve':
+    run_archiver_service(twitch_api, gql_api, mediacms_api, args.host, args.port, output_folder, args.delete, hash_index, spool, args.jobs)
   
\ No newline at end of file
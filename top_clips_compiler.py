@@ -8,19 +8,32 @@ import datetime
 from pathlib import Path
 from datetime import datetime, timedelta
 from util.mediacms import MediaCMS_API
+from util.pagination import iter_clips, iter_videos
+from util.topk import TopKSelector
 from luscioustwitch import *
 
 FONT_SIZE=36
 
-def get_clip_true_time(twitch_api : TwitchAPI, clip_info : TwitchClip):
+def get_clip_true_time(twitch_api : TwitchAPI, clip_info : TwitchClip, video_cache : dict = None):
   if clip_info.video_id != '':
-    video_info = twitch_api.get_video(clip_info.video_id)
+    if video_cache is None:
+      video_info = twitch_api.get_video(clip_info.video_id)
+    else:
+      if clip_info.video_id not in video_cache:
+        video_cache[clip_info.video_id] = twitch_api.get_video(clip_info.video_id)
+      video_info = video_cache[clip_info.video_id]
     offset = int(clip_info.vod_offset)
     vod_start = video_info.created_at
     clip_time = vod_start + timedelta(seconds=offset)
     return clip_time
   else:
     return clip_info.created_at
+  
+def clips_overlap(a : typing.Tuple[datetime, int, TwitchClip], b : typing.Tuple[datetime, int, TwitchClip]) -> bool:
+  if (a[2].video_id == '' or a[2].vod_offset == None or b[2].video_id == '' or b[2].vod_offset == None):
+    return abs(a[0] - b[0]).total_seconds() < 90
+  # check if clips are from the same vod and within 90 seconds of each other.
+  return (a[2].video_id == b[2].video_id) and (abs(int(a[2].vod_offset) - int(b[2].vod_offset)) < 90)
     
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
@@ -81,70 +94,55 @@ if __name__ == '__main__':
   stats['videos'] = { 'list': []}
   stats['chat']   = { 'list': [] }
 
-  num_clips = 0
   num_checked = 0
-  video_clips = []
-  after = ""
-  continue_fetching = True
-  continue_adding = True
+  video_cache = {}
   clip_params = {
     "first": 100,
     "broadcaster_id": user_id,
     "started_at": buffered_start_datetime.astimezone(pytz.utc).strftime(TWITCH_API_TIME_FORMAT),
     "ended_at": buffered_end_datetime.astimezone(pytz.utc).strftime(TWITCH_API_TIME_FORMAT)
   }
-  while continue_fetching:
-    clips, cursor = twitch_api.get_clips(params=clip_params)
-
-    if cursor != "":
-      clip_params["after"] = cursor
-    else:
-      continue_fetching = False
-
-    clip : TwitchClip
-    for clip in clips:
-      num_checked += 1
-      views = int(clip.view_count)
-      clip_date = pytz.utc.localize(get_clip_true_time(twitch_api, clip), is_dst=None).astimezone(local)
-      
-      if not (buffered_start_datetime < clip_date < buffered_end_datetime):
-        print("Clip not in range: ", clip.title, clip_date.strftime(TWITCH_API_TIME_FORMAT))
-        continue
+  
+  def skip_overlapping(a, b):
+    if clips_overlap(a, b):
+      print(f"Skipping \"{a[2].title}\" because \"{b[2].title}\" was already included.")
+      return True
+    return False
+  
+  selector = TopKSelector(args.max, skip_overlapping)
+  
+  # Clips come by view count descending, so once the selection is full nothing later can get in.
+  # Stats only need the Helix fields, so they keep reading the stream without resolving true times.
+  clip : TwitchClip
+  for clip in iter_clips(twitch_api, clip_params, min_views = 5):
+    num_checked += 1
+    views = int(clip.view_count)
+    
+    if (args.title is not None) and (args.title.lower() not in clip.title.lower()):
+      continue
       
-      if (args.title is not None) and (args.title.lower() not in clip.title.lower()):
-        continue
-        
-      if (args.creator is not None) and (args.creator.lower() not in clip.creator_name.lower()):
-        continue
-
-      add_clip = continue_adding
-      if continue_adding:
-        c : typing.Tuple[datetime.datetime, int, TwitchClip]
-        for c in video_clips:
-          if (clip.video_id == '' or clip.vod_offset == None or c[2].video_id == '' or c[2].vod_offset == None):
-            if abs(c[0] - clip_date).total_seconds() < 90:
-              print(f"Skipping \"{clip.title}\" because \"{c[2].title}\" was already included.")
-              add_clip = False
-          # check if clips are from the same day and within 90 seconds of each other.
-          elif (c[2].video_id == clip.video_id) and (abs(int(c[2].vod_offset) - int(clip.vod_offset)) < 90):
-            print(f"Skipping \"{clip.title}\" because \"{c[2].title}\" was already included.")
-            add_clip = False
-        
+    if (args.creator is not None) and (args.creator.lower() not in clip.creator_name.lower()):
+      continue
+    
+    if args.stats:
       stats['clips']['list'].append(clip)
-      if add_clip:
-        video_clips.append((clip_date, views, clip))
-        num_clips += 1
-
-      if num_clips >= args.max:
-        if not args.stats:
-          continue_fetching = False
-          break
-        else:
-          continue_adding = False
-      if views < 5:
-        continue_fetching = False
-        break
-    print(f"Checked {num_checked} clips so far.")
+    
+    if not selector.can_enter(views):
+      if args.stats:
+        continue
+      break
+    
+    clip_date = pytz.utc.localize(get_clip_true_time(twitch_api, clip, video_cache), is_dst=None).astimezone(local)
+    
+    if not (buffered_start_datetime < clip_date < buffered_end_datetime):
+      print("Clip not in range: ", clip.title, clip_date.strftime(TWITCH_API_TIME_FORMAT))
+      continue
+    
+    selector.offer(views, (clip_date, views, clip))
+    
+  print(f"Checked {num_checked} clips.")
+  
+  video_clips = selector.selected()
       
   print(f"Got {len(video_clips)} clips.")
 
@@ -162,13 +160,14 @@ if __name__ == '__main__':
       
   if args.stats:
     video_params = {
+      "first": 100,
       "user_id": user_id,
       "period": "all",
       "sort": "time",
       "type": "archive"
     }
-    print("Getting all videos on channel.")
-    videos = twitch_api.get_all_videos(video_params)
+    print("Getting videos in the period.")
+    videos = iter_videos(twitch_api, video_params, published_after = buffered_start_datetime)
     
     video : TwitchVideo
     for video in videos:
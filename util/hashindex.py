@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+
+from util.mediacms import MediaCMS_API
+
+FINGERPRINT_FRAMES = 4
+FINGERPRINT_SIZE = 8
+FINGERPRINT_MAX_DISTANCE = 10
+
+def file_sha256(filepath) -> str:
+  sha = hashlib.sha256()
+  with open(filepath, 'rb') as f:
+    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+      sha.update(chunk)
+  return sha.hexdigest()
+
+def file_fingerprint(filepath) -> str:
+  # Average hash of a handful of tiny grayscale frames, one per second from the start of the clip.
+  frame_bytes = FINGERPRINT_SIZE * FINGERPRINT_SIZE
+  o = subprocess.run(['ffmpeg', '-v', 'error', '-i', str(filepath), '-vf', f'fps=1,scale={FINGERPRINT_SIZE}:{FINGERPRINT_SIZE},format=gray', '-frames:v', str(FINGERPRINT_FRAMES), '-f', 'rawvideo', 'pipe:1'], capture_output = True)
+
+  if o.returncode != 0 or len(o.stdout) < frame_bytes:
+    return None
+
+  bits = ""
+  for i in range(0, len(o.stdout) // frame_bytes):
+    frame = o.stdout[i * frame_bytes:(i + 1) * frame_bytes]
+    mean = sum(frame) / frame_bytes
+    bits += "".join("1" if p > mean else "0" for p in frame)
+
+  return f"{int(bits, 2):0{len(bits) // 4}x}"
+
+def fingerprint_distance(a : str, b : str) -> int:
+  if a is None or b is None or len(a) != len(b):
+    return None
+  return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+class MediaHashIndex:
+  filepath = None
+  entries = None
+  lock = None
+
+  def __init__(self, filepath):
+    self.filepath = os.path.abspath(filepath)
+    self.entries = {}
+    self.lock = threading.Lock()
+
+    if os.path.exists(self.filepath):
+      with open(self.filepath, 'r') as indexfile:
+        self.entries = json.load(indexfile)
+
+  def save(self):
+    with self.lock:
+      tmp_path = f"{self.filepath}.tmp"
+      with open(tmp_path, 'w') as indexfile:
+        json.dump(self.entries, indexfile, indent = 2)
+      os.replace(tmp_path, self.filepath)
+
+  def hash_file(self, filepath) -> dict:
+    return {
+      'sha256': file_sha256(filepath),
+      'fingerprint': file_fingerprint(filepath)
+    }
+
+  def add(self, friendly_token : str, filepath, entry : dict = None):
+    if entry is None:
+      entry = self.hash_file(filepath)
+    with self.lock:
+      self.entries[friendly_token] = entry
+    return entry
+
+  def sync(self, mediacms_api : MediaCMS_API) -> int:
+    # Only media that has not been hashed yet gets downloaded, so after the first run this is just the listing.
+    # A strict listing raises instead of leaving the index silently incomplete.
+    clips = mediacms_api.get_clips(strict = True)
+
+    with self.lock:
+      missing = [clip['friendly_token'] for clip in clips if clip['friendly_token'] not in self.entries]
+
+    print(f"Hashing {len(missing)} archived clips not in the hash index yet.")
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmpdir:
+      for token in missing:
+        tmp_file = os.path.join(tmpdir, f"{token}.mp4")
+        try:
+          mediacms_api.download_clip(token, tmp_file)
+          self.add(token, tmp_file)
+        except Exception as e:
+          print(f"Failed to hash archived clip {token}.")
+          print(e)
+          failed += 1
+          continue
+        finally:
+          if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+        self.save()
+
+    return failed
+
+  def find_match(self, entry : dict) -> str:
+    # Only identical files count as already archived.
+    with self.lock:
+      entries = list(self.entries.items())
+
+    for token, other in entries:
+      if other['sha256'] == entry['sha256']:
+        return token
+
+    return None
+
+  def find_similar(self, entry : dict) -> list:
+    # Fingerprints only cover a few tiny frames from the start of a clip, so a hit here is just a candidate
+    # (static scenes, fades and overlays hash close together) and is never enough to skip an upload.
+    if entry['fingerprint'] is None:
+      return []
+
+    with self.lock:
+      entries = list(self.entries.items())
+
+    similar = []
+    for token, other in entries:
+      distance = fingerprint_distance(entry['fingerprint'], other['fingerprint'])
+      if distance is not None and distance <= FINGERPRINT_MAX_DISTANCE:
+        similar.append(token)
+
+    return similar
@@ -1,5 +1,6 @@
 import re
 import requests
+from concurrent.futures import ThreadPoolExecutor
 
 MEDIACMS_VIDEO_REGEX = re.compile(r"(https?\:\/\/[A-Za-z0-9\.]+)\/view\?m=(.*)")
 
@@ -11,7 +12,7 @@ class MediaCMS_API:
     self.base_url = base_url
     self.auth = auth
     
-  def get_clips(self):
+  def get_clips(self, strict = False):
     api_url = f"{self.base_url}/api/v1/media"
     
     clip_data = []
@@ -19,6 +20,9 @@ class MediaCMS_API:
       resp = requests.get(url = api_url, auth = self.auth)
       
       if resp.status_code != 200:
+        # strict callers can't work with a partial listing.
+        if strict:
+          raise Exception(f"Response {resp.status_code}: {resp.reason}")
         return clip_data
       
       resp_json = resp.json()
@@ -49,6 +53,34 @@ class MediaCMS_API:
 
     return r.content
 
+  def get_clip_thumbnails_raw(self, clip_ids, cache, clips = None, max_workers = 8):
+    # With a get_clips() listing each thumbnail is a single request, otherwise the URL comes from get_clip_info.
+    thumbnail_urls = {}
+    if clips is not None:
+      thumbnail_urls = { clip['friendly_token']: clip['thumbnail_url'] for clip in clips if clip.get('thumbnail_url', None) }
+
+    def fetch_thumbnail(clip_id):
+      try:
+        thumbnail_partial_url = thumbnail_urls.get(clip_id, None)
+        if thumbnail_partial_url is None:
+          thumbnail_partial_url = self.get_clip_info(clip_id)['thumbnail_url']
+        return cache.fetch(clip_id, f"{self.base_url}{thumbnail_partial_url}")
+      except Exception as e:
+        print(f"Failed to fetch thumbnail for {clip_id}.")
+        print(e)
+        return None
+
+    # Materialize (generators would be used up by map) and drop duplicates so no two threads write the same file.
+    clip_ids = list(dict.fromkeys(clip_ids))
+
+    try:
+      with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        thumbnails = dict(zip(clip_ids, executor.map(fetch_thumbnail, clip_ids)))
+    finally:
+      cache.save()
+
+    return thumbnails
+
   def download_clip(self, clip_id, filename):
     info = self.get_clip_info(clip_id)
     media_url = info['original_media_url']
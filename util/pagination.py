@@ -0,0 +1,53 @@
+import datetime
+import time
+
+import pytz
+from luscioustwitch import TwitchAPI, TwitchClip, TwitchVideo
+
+def to_naive_utc(dt : datetime.datetime) -> datetime.datetime:
+  # Helix timestamps come back as tz-aware UTC. Naive datetimes are assumed to already be UTC.
+  if dt is None or dt.tzinfo is None:
+    return dt
+  return dt.astimezone(pytz.utc).replace(tzinfo = None)
+
+def _pages(fetch_page, params : dict, retry_delay : int):
+  params = dict(params)
+  while True:
+    try:
+      items, cursor = fetch_page(params)
+    except Exception as e:
+      if retry_delay is None:
+        raise
+      print(e)
+      time.sleep(retry_delay)
+      print("Continuing search...")
+      continue
+
+    yield items
+
+    if cursor == "":
+      return
+    params["after"] = cursor
+
+def iter_videos(twitch_api : TwitchAPI, params : dict, published_after : datetime.datetime = None, stop_at_video_id : str = None, retry_delay : int = None):
+  # Videos sorted by "time" come newest first, so paging stops at the first video older than published_after
+  # or at stop_at_video_id (neither is yielded) instead of walking the whole channel history.
+  published_after = to_naive_utc(published_after)
+
+  video : TwitchVideo
+  for videos in _pages(twitch_api.get_videos, params, retry_delay):
+    for video in videos:
+      if stop_at_video_id is not None and video.video_id == stop_at_video_id:
+        return
+      if published_after is not None and to_naive_utc(video.published_at) < published_after:
+        return
+      yield video
+
+def iter_clips(twitch_api : TwitchAPI, params : dict, min_views : int = None, retry_delay : int = None):
+  # Helix returns clips by view count descending, so nothing after the first clip under min_views can match.
+  clip : TwitchClip
+  for clips in _pages(twitch_api.get_clips, params, retry_delay):
+    for clip in clips:
+      if min_views is not None and int(clip.view_count) < min_views:
+        return
+      yield clip
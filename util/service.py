@@ -0,0 +1,166 @@
+import json
+import queue
+import threading
+import time
+import traceback
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Finished jobs are kept around for status queries until they expire.
+FINISHED_JOB_TTL = 24 * 3600
+MAX_FINISHED_JOBS = 1000
+
+class ArchiveJobQueue:
+  handlers = None
+  jobs = None
+  active_keys = None
+  lock = None
+  lanes = None
+  pending = None
+
+  def __init__(self, handlers : dict, lanes : dict = None):
+    # handlers maps a job type to a callable that takes the job params. Its return value is stored as the job result.
+    # lanes maps a job type to a lane name; each lane has its own worker, so slow job types don't hold up the others.
+    self.handlers = handlers
+    self.lanes = lanes if lanes is not None else {}
+    self.jobs = {}
+    self.active_keys = {}
+    self.lock = threading.Lock()
+    self.pending = { lane: queue.Queue() for lane in set(self.lanes.get(job_type, 'default') for job_type in handlers) }
+
+  def submit(self, job_type : str, key : str, params : dict) -> dict:
+    if job_type not in self.handlers:
+      raise ValueError(f"Unknown job type \"{job_type}\".")
+
+    with self.lock:
+      # A job that is already queued or running is reused instead of being archived twice.
+      if key in self.active_keys:
+        return self.jobs[self.active_keys[key]]
+
+      job = {
+        'id': uuid.uuid4().hex,
+        'type': job_type,
+        'key': key,
+        'params': params,
+        'status': 'queued',
+        'error': None,
+        'result': None,
+        'submitted_at': time.time(),
+        'finished_at': None
+      }
+      self.jobs[job['id']] = job
+      self.active_keys[key] = job['id']
+
+    self.pending[self.lanes.get(job_type, 'default')].put(job['id'])
+    return job
+
+  def _expire_finished(self):
+    finished = sorted([job for job in self.jobs.values() if job['finished_at'] is not None], key = lambda j: j['finished_at'])
+    cutoff = time.time() - FINISHED_JOB_TTL
+    for i, job in enumerate(finished):
+      if job['finished_at'] < cutoff or len(finished) - i > MAX_FINISHED_JOBS:
+        del self.jobs[job['id']]
+
+  def get(self, job_id : str) -> dict:
+    with self.lock:
+      return self.jobs.get(job_id, None)
+
+  def all(self) -> list:
+    with self.lock:
+      return list(self.jobs.values())
+
+  def run_forever(self, lane : str):
+    while True:
+      job_id = self.pending[lane].get()
+      job = self.jobs[job_id]
+
+      job['status'] = 'running'
+      try:
+        job['result'] = self.handlers[job['type']](job['params'])
+        job['status'] = 'done'
+      except Exception as e:
+        traceback.print_exc()
+        job['status'] = 'failed'
+        job['error'] = str(e)
+
+      with self.lock:
+        job['finished_at'] = time.time()
+        del self.active_keys[job['key']]
+        self._expire_finished()
+
+  def start(self):
+    workers = []
+    for lane in self.pending:
+      worker = threading.Thread(target = self.run_forever, args = (lane,), daemon = True)
+      worker.start()
+      workers.append(worker)
+    return workers
+
+class ArchiveRequestHandler(BaseHTTPRequestHandler):
+  job_queue : ArchiveJobQueue = None
+  job_expander = None
+
+  def _send_json(self, status : int, data):
+    body = json.dumps(data).encode('utf-8')
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_GET(self):
+    if self.path == '/jobs':
+      self._send_json(200, self.job_queue.all())
+      return
+
+    if self.path.startswith('/jobs/'):
+      job = self.job_queue.get(self.path[len('/jobs/'):])
+      if job is None:
+        self._send_json(404, { 'error': "Job not found." })
+      else:
+        self._send_json(200, job)
+      return
+
+    self._send_json(404, { 'error': "Not found." })
+
+  def do_POST(self):
+    if self.path != '/jobs':
+      self._send_json(404, { 'error': "Not found." })
+      return
+
+    try:
+      length = int(self.headers.get('Content-Length', 0))
+      request = json.loads(self.rfile.read(length))
+      # The expander turns one request into (type, key, params) jobs, e.g. one job per clip in a list.
+      jobs = [self.job_queue.submit(job_type, key, params) for job_type, key, params in self.job_expander(request)]
+    except Exception as e:
+      self._send_json(400, { 'error': str(e) })
+      return
+
+    self._send_json(200, { 'jobs': jobs })
+
+def serve(host : str, port : int, job_queue : ArchiveJobQueue, job_expander):
+  handler = type('BoundArchiveRequestHandler', (ArchiveRequestHandler,), { 'job_queue': job_queue, 'job_expander': staticmethod(job_expander) })
+
+  job_queue.start()
+  server = ThreadingHTTPServer((host, port), handler)
+  print(f"Archiver service listening on http://{host}:{port}")
+  server.serve_forever()
+
+def submit_job(server_url : str, request : dict) -> list:
+  resp = requests.post(f"{server_url}/jobs", json = request)
+
+  if resp.status_code == 200:
+    return resp.json()['jobs']
+  else:
+    raise Exception(f"Response {resp.status_code}: {resp.json().get('error', resp.reason)}")
+
+def get_job(server_url : str, job_id : str) -> dict:
+  resp = requests.get(f"{server_url}/jobs/{job_id}")
+
+  if resp.status_code == 200:
+    return resp.json()
+  else:
+    raise Exception(f"Response {resp.status_code}: {resp.reason}")
@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+
+class SpoolReservation:
+  estimate = 0
+
+  def __init__(self, estimate : int):
+    self.estimate = estimate
+
+class SpoolManager:
+  folder = None
+  quota_bytes = 0
+  reserved_bytes = 0
+  in_flight = 0
+  artifacts = None
+  condition = None
+
+  def __init__(self, folder, quota_bytes : int):
+    self.folder = os.path.abspath(folder)
+    self.quota_bytes = quota_bytes
+    self.artifacts = {}
+    # Only files committed through this spool are tracked; anything already in the folder is left alone.
+    self.condition = threading.Condition()
+
+  def used_bytes(self) -> int:
+    return self.reserved_bytes + sum(artifact['size'] for artifact in self.artifacts.values())
+
+  def _evict_until(self, needed : int):
+    completed = sorted([(artifact['last_used'], path) for path, artifact in self.artifacts.items() if artifact['complete']])
+    for _, path in completed:
+      if self.used_bytes() + needed <= self.quota_bytes:
+        break
+      print(f"Evicting {os.path.basename(path)} from the download folder.")
+      if os.path.exists(path):
+        os.remove(path)
+      del self.artifacts[path]
+
+  def reserve(self, estimate : int) -> SpoolReservation:
+    # Blocks until the download fits. Uploads never reserve, so files already on disk always get to finish
+    # and free their space before more downloads are admitted.
+    with self.condition:
+      while True:
+        if self.used_bytes() + estimate > self.quota_bytes:
+          self._evict_until(estimate)
+
+        # A download bigger than the whole quota is still admitted once nothing else is downloading or uploading.
+        busy = self.in_flight + len([artifact for artifact in self.artifacts.values() if not artifact['complete'] and not artifact['pinned']])
+        if self.used_bytes() + estimate <= self.quota_bytes or busy == 0:
+          self.reserved_bytes += estimate
+          self.in_flight += 1
+          return SpoolReservation(estimate)
+
+        self.condition.wait()
+
+  def commit(self, reservation : SpoolReservation, paths : list):
+    with self.condition:
+      self.reserved_bytes -= reservation.estimate
+      self.in_flight -= 1
+      for path in paths:
+        path = os.path.abspath(path)
+        if os.path.exists(path):
+          self.artifacts[path] = { 'size': os.path.getsize(path), 'complete': False, 'pinned': False, 'last_used': time.time() }
+      self.condition.notify_all()
+
+  def complete(self, path):
+    # Only call this once the file is safe to lose, e.g. a clip after its upload.
+    with self.condition:
+      path = os.path.abspath(path)
+      if path in self.artifacts:
+        self.artifacts[path]['complete'] = True
+        self.artifacts[path]['last_used'] = time.time()
+      self.condition.notify_all()
+
+  def pin(self, path):
+    # For files that must stay on disk, like end products and clips whose upload failed.
+    # They keep counting against the quota but are never evicted.
+    with self.condition:
+      path = os.path.abspath(path)
+      if path in self.artifacts:
+        self.artifacts[path]['pinned'] = True
+      self.condition.notify_all()
+
+  def remove(self, path):
+    with self.condition:
+      path = os.path.abspath(path)
+      if os.path.exists(path):
+        os.remove(path)
+      self.artifacts.pop(path, None)
+      self.condition.notify_all()
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+import time
+
+import requests
+
+class ThumbnailCache:
+  folder = None
+  max_bytes = 0
+  entries = None
+  lock = None
+
+  def __init__(self, folder, max_bytes = 256 * 1024 * 1024):
+    self.folder = os.path.abspath(folder)
+    self.max_bytes = max_bytes
+    self.entries = {}
+    self.lock = threading.Lock()
+
+    os.makedirs(self.folder, exist_ok = True)
+
+    index_path = self._index_path()
+    if os.path.exists(index_path):
+      with open(index_path, 'r') as indexfile:
+        self.entries = json.load(indexfile)
+
+  def _index_path(self):
+    return os.path.join(self.folder, "index.json")
+
+  def _file_path(self, clip_id):
+    return os.path.join(self.folder, f"{clip_id}.jpg")
+
+  def save(self):
+    with self.lock:
+      tmp_path = f"{self._index_path()}.tmp"
+      with open(tmp_path, 'w') as indexfile:
+        json.dump(self.entries, indexfile, indent = 2)
+      os.replace(tmp_path, self._index_path())
+
+  def fetch(self, clip_id : str, url : str) -> bytes:
+    with self.lock:
+      entry = self.entries.get(clip_id, None)
+
+    cached = None
+    headers = {}
+    if entry is not None and entry['url'] == url and os.path.exists(self._file_path(clip_id)):
+      with open(self._file_path(clip_id), 'rb') as f:
+        cached = f.read()
+      if entry.get('etag', None):
+        headers['If-None-Match'] = entry['etag']
+      if entry.get('last_modified', None):
+        headers['If-Modified-Since'] = entry['last_modified']
+
+    r = requests.get(url, headers = headers)
+
+    if r.status_code == 304 and cached is not None:
+      with self.lock:
+        entry['accessed'] = time.time()
+      return cached
+
+    if r.status_code != 200:
+      return cached
+
+    with open(self._file_path(clip_id), 'wb') as f:
+      f.write(r.content)
+
+    with self.lock:
+      self.entries[clip_id] = {
+        'url': url,
+        'etag': r.headers.get('ETag', None),
+        'last_modified': r.headers.get('Last-Modified', None),
+        'size': len(r.content),
+        'accessed': time.time()
+      }
+
+    self.evict()
+    return r.content
+
+  def evict(self):
+    with self.lock:
+      total = sum(entry['size'] for entry in self.entries.values())
+      for clip_id, entry in sorted(self.entries.items(), key = lambda e: e[1]['accessed']):
+        if total <= self.max_bytes:
+          break
+        if os.path.exists(self._file_path(clip_id)):
+          os.remove(self._file_path(clip_id))
+        total -= entry['size']
+        del self.entries[clip_id]
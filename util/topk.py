@@ -0,0 +1,41 @@
+import heapq
+
+class TopKSelector:
+  k = 0
+  heap = None
+  conflicts = None
+  count = 0
+
+  def __init__(self, k : int, conflicts = None):
+    # conflicts(a, b) -> True when two items can't both be selected, e.g. clips of the same moment.
+    self.k = k
+    self.heap = []
+    self.conflicts = conflicts
+    self.count = 0
+
+  def full(self) -> bool:
+    return len(self.heap) >= self.k
+
+  def can_enter(self, score) -> bool:
+    # Ties keep the item that was offered first.
+    return not self.full() or score > self.heap[0][0]
+
+  def selected(self) -> list:
+    return [entry[2] for entry in self.heap]
+
+  def offer(self, score, item) -> bool:
+    if not self.can_enter(score):
+      return False
+
+    if self.conflicts is not None:
+      for other in self.selected():
+        if self.conflicts(item, other):
+          return False
+
+    self.count += 1
+    entry = (score, -self.count, item)
+    if self.full():
+      heapq.heapreplace(self.heap, entry)
+    else:
+      heapq.heappush(self.heap, entry)
+    return True